@@ -9,6 +9,9 @@ from typeguard import typechecked
 class Region:
     """A base class to store the name and geographical boundary of some region."""
 
+    # a Region is built for every boundary in every lookup result; slots skip the per-instance dict
+    __slots__ = ("btype", "name", "boundary", "identifier", "metadata")
+
     def __init__(
         self,
         btype: str,
@@ -39,17 +42,12 @@ class Region:
             other: region or shape to check against
         """
         if isinstance(other, Region):
-            return self.boundary.contains(other.boundary)
-        elif (
-            isinstance(other, Point)
-            or isinstance(other, Polygon)
-            or isinstance(other, MultiPolygon)
-        ):
-            return self.boundary.contains(other)
-        else:
+            other = other.boundary
+        elif not isinstance(other, (Point, Polygon, MultiPolygon)):
             raise TypeError(
                 f"other must be one of: 'Region', 'Point', 'Polygon', 'MultiPolygon'. got: { type(other) }"
             )
+        return self.boundary.contains(other)
     
     def as_dict(self) -> Dict[str, str | int | None]:
         return {
@@ -1,16 +1,21 @@
 from __future__ import annotations
-import fiona
 import pickle
 import geopandas as gpd
-from math import isnan
+import numpy as np
+import pyogrio
+import shapely
 from shapely.geometry import Point
 from . import Region
+from functools import lru_cache
 from json import dump
-from typing import Dict
+from typing import Dict, Tuple
 from pathlib import Path
 
 class State:
     """A class to represent a state that the client can request district info from."""
+
+    _bulk_chunk_size = 100_000
+    _lookup_cache_size = 100_000
     
     def __init__(self, tables: Dict[str, gpd.GeoDataFrame], precinct_lookup_table: gpd.GeoDataFrame):
         """Initializes State object with the given region and lookup tables.
@@ -23,6 +28,47 @@ class State:
         self.tables = tables
         self.lookup_table = precinct_lookup_table
         self.btypes = list(tables.keys())
+        self._build_index()
+
+    def _build_index(self):
+        """Builds the spatial index, geometry array, and region id matrix used to
+        look up precincts and the regions containing them."""
+        self._precinct_index = self.lookup_table.sindex
+        self._precinct_geoms = np.asarray(self.lookup_table.geometry.values)
+        # prepares the geometries in place, so precinct Regions share the prepared shapes too
+        shapely.prepare(self._precinct_geoms)
+        # one row per precinct, one column per btype; -1 where no region of that btype contains it
+        self._region_ids = self.lookup_table[self.btypes].fillna(-1).to_numpy(dtype=np.int64)
+        # the columns Regions are built from, so a lookup indexes arrays instead of building a row Series
+        self._precinct_columns = State._region_columns(self.lookup_table)
+        self._btype_columns = {btype: State._region_columns(table) for btype, table in self.tables.items()}
+        # repeat queries for the same coordinates skip the spatial query entirely
+        self._locate_point = lru_cache(maxsize=State._lookup_cache_size)(self._locate_point_uncached)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # derived from the lookup table; rebuilt on unpickling rather than stored
+        state.pop("_precinct_index", None)
+        state.pop("_precinct_geoms", None)
+        state.pop("_region_ids", None)
+        state.pop("_precinct_columns", None)
+        state.pop("_btype_columns", None)
+        state.pop("_locate_point", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._build_index()
+
+    @staticmethod
+    def _region_columns(table: gpd.GeoDataFrame) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Returns the names, geometries, and ids of the given table's rows as arrays,
+        with None for each row of a column the table does not have."""
+        def column_or_none(column: str) -> np.ndarray:
+            if column in table.columns:
+                return table[column].to_numpy()
+            return np.full(len(table), None, dtype=object)
+        return column_or_none("name"), np.asarray(table.geometry.values), column_or_none("id")
 
     @staticmethod
     def from_cache(filepath: str | Path) -> State:
@@ -48,7 +94,9 @@ class State:
             FileNotFoundError: if directory of requested filepath does not exist.
         """
         with open(filepath, "wb") as f:
-            pickle.dump(self, f)
+            # geometry columns already pickle as one WKB array each; protocol 5 writes
+            # numpy buffers without the extra copies protocol 4 makes
+            pickle.dump(self, f, protocol=5)
             
     def to_dir(self, path: str | Path):
         """Writes the current state object at the given path as a directory
@@ -85,12 +133,12 @@ class State:
         
         lookup_table_shallow_copy = self.lookup_table.copy(deep=False)
         lookup_table_shallow_copy["index"] = lookup_table_shallow_copy.index
-        lookup_table_shallow_copy.to_file(data_path, layer="precinct", driver="GPKG")
+        lookup_table_shallow_copy.to_file(data_path, layer="precinct", driver="GPKG", engine="pyogrio")
         
         for btype, table in self.tables.items():
             table_shallow_copy = table.copy(deep=False)
             table_shallow_copy["index"] = table_shallow_copy.index
-            table_shallow_copy.to_file(data_path, layer=btype, driver="GPKG")
+            table_shallow_copy.to_file(data_path, layer=btype, driver="GPKG", engine="pyogrio")
     
     @staticmethod
     def from_dir(path: str | Path) -> State:
@@ -112,7 +160,7 @@ class State:
         if not (data_path.exists() and data_path.is_file()):
             raise ValueError(f"Could not find data.gpkg in {str(path)}")
         
-        layers = fiona.listlayers(data_path)
+        layers = [name for name, _ in pyogrio.list_layers(data_path)]
         if "precinct" not in layers:
             raise RuntimeError(f"data.gpkg does not include required layer 'precinct'")
         layers.remove("precinct")
@@ -121,12 +169,14 @@ class State:
         tables = {}
         for layer_name in layers:
             tables[layer_name] = State._read_layer_and_index(data_path, layer_name)
+            # GeoPackage reads integer columns with missing values back as floats
+            lookup_table[layer_name] = lookup_table[layer_name].astype("Int32")
         
         return State(tables, lookup_table)
 
     @staticmethod
     def _read_layer_and_index(path: Path, layer: str) -> gpd.GeoDataFrame:
-        table = gpd.read_file(path, layer=layer)
+        table = gpd.read_file(path, layer=layer, engine="pyogrio")
         if "index" not in table.columns:
             raise RuntimeError(f"{ layer } layer does not contain index column")
         table.set_index("index", inplace=True, drop=True)
@@ -150,26 +200,78 @@ class State:
         """Looks up the given (latitude, longitude) """
         pt = Point(lat, lon)
         return self._lookup_point(pt)
+
+    def lookup_lat_lon_bulk(self, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+        """Looks up the precinct containing each of the given (latitude, longitude) pairs.
+
+        Args:
+            lats: latitudes of the points to look up
+            lons: longitudes of the points to look up, in the same order as lats
+
+        Returns:
+            an array with, for each point, the position in the lookup table of the
+            precinct containing it, or -1 if no single precinct contains it.
+
+        Raises:
+            ValueError: if lats and lons do not have the same shape.
+        """
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        if lats.shape != lons.shape:
+            raise ValueError(f"lats and lons must have the same shape. Got: {lats.shape} and {lons.shape}")
+        xs, ys = lons.ravel(), lats.ravel()
+        positions = np.full(len(xs), -1, dtype=np.int64)
+        # points are located in chunks so the temporary point geometries and
+        # candidate pairs stay bounded however large the batch is
+        for start in range(0, len(xs), State._bulk_chunk_size):
+            chunk = slice(start, start + State._bulk_chunk_size)
+            chunk_positions, counts = self._locate_points(xs[chunk], ys[chunk])
+            chunk_positions[counts != 1] = -1
+            positions[chunk] = chunk_positions
+        return positions.reshape(lats.shape)
+
+    def _locate_points(self, xs: np.ndarray, ys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the lookup table position of a precinct containing each (x, y) point,
+        or -1 where there is none, along with the number of precincts containing each point."""
+        point_idx, candidate_idx = State._containing_pairs(self._precinct_index, self._precinct_geoms, xs, ys)
+        positions = np.full(len(xs), -1, dtype=np.int64)
+        positions[point_idx] = candidate_idx
+        return positions, np.bincount(point_idx, minlength=len(xs))
+    
+    @staticmethod
+    def _containing_pairs(index: gpd.sindex.SpatialIndex, geometries: np.ndarray,
+                          xs: np.ndarray, ys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the (point position, geometry position) pairs where a geometry contains
+        one of the (x, y) points, given the spatial index built over those geometries."""
+        # prune to geometries whose bounding box holds each point, then run the exact test on those pairs
+        point_idx, geometry_idx = index.query(shapely.points(xs, ys))
+        inside = shapely.contains_xy(geometries[geometry_idx], xs[point_idx], ys[point_idx])
+        return point_idx[inside], geometry_idx[inside]
+    
+    def _locate_point_uncached(self, x: float, y: float) -> Tuple[int, int]:
+        """Returns the lookup table position of a precinct containing the point (x, y),
+        or -1 if there is none, along with the number of precincts containing it."""
+        positions, counts = self._locate_points(np.array([x]), np.array([y]))
+        return int(positions[0]), int(counts[0])
     
     def _lookup_point(self, pt: Point): # pt = coord as (lat, long)
         long_lat = Point(pt.y, pt.x)
-        lookup_result = self.lookup_table.loc[self.lookup_table.contains(long_lat)]
-        if len(lookup_result) == 0:
+        position, count = self._locate_point(long_lat.x, long_lat.y)
+        if count == 0:
             raise LookupError(f"Could not find precinct for coordinates:\n" + \
                               f"Latitude: {long_lat.y}, Longitude: {long_lat.x}")
-        elif len(lookup_result) > 1:
+        elif count > 1:
             raise LookupError(f"Too many precincts found for coordinates:\n" + \
                               f"Latitude: {long_lat.y}, Longitude: {long_lat.x}")
         # successful lookup, retrieve all boundary info
-        single_result = lookup_result.iloc[0]
+        names, geometries, ids = self._precinct_columns
         boundary_info = {}
         boundary_info["precinct"] = Region("precinct",
-                                           str(single_result.get("name")),
-                                           single_result.get("geometry"),
-                                           single_result.get("id"))
-        for btype in self.btypes:
-            btype_id = single_result[btype]
-            if isnan(btype_id) or btype_id is None:
+                                           str(names[position]),
+                                           geometries[position],
+                                           ids[position])
+        for btype, btype_id in zip(self.btypes, self._region_ids[position]):
+            if btype_id < 0:
                 boundary_info[btype] = None
             else:
                 boundary_info[btype] = self._lookup_btype_id(btype, int(btype_id))
@@ -178,9 +280,8 @@ class State:
     def _lookup_btype_id(self, btype: str, id: int):
         if btype not in self.btypes:
             raise ValueError(f"Boundary type {btype} is not one of {self.btypes}.")
-        btable = self.tables[btype]
+        names, geometries, ids = self._btype_columns[btype]
         try:
-            result = btable.iloc[id]
+            return Region(btype, str(names[id]), geometries[id], identifier=ids[id])
         except IndexError as ie:
-            raise LookupError(f"Could not find {btype} with id {id}. Found {len(result)}.") from ie
-        return Region(btype, str(result["name"]), result["geometry"], identifier=result.get("id"))
+            raise LookupError(f"Could not find {btype} with id {id}. The {btype} table has {len(names)} entries.") from ie
@@ -1,24 +1,39 @@
 from __future__ import annotations
 
 import geopandas as gpd
-import json
+import ijson
+import numpy as np
+import orjson
 import pandas as pd
 import re
+import shapely
+import shutil
 import warnings
 import zipfile
 
-from io import BytesIO
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tempfile import TemporaryDirectory
 from typing import List, Dict, Tuple
-from pathlib import Path
-from requests import Request, Session
+from fnmatch import fnmatch
+from pathlib import Path, PurePosixPath
+from pyproj import CRS
+from requests import PreparedRequest, Request, Response, Session
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 from requests.exceptions import ConnectionError, Timeout, RequestException
 from typeguard import typechecked
+from urllib.parse import urlparse
+
+# built once rather than parsed from "epsg:4326" for every layer
+_WGS84 = CRS.from_epsg(4326)
 
 @typechecked
-def fetch_from_json(filepath: str | Path, output_dir: str | Path):
-    """Provide a json file with configuration info used to fetch data and write to files."""
+def fetch_from_json(filepath: str | Path, output_dir: str | Path, overwrite_existing: bool = True):
+    """Provide a json file with configuration info used to fetch data and write to files.
+
+    If overwrite_existing is False, layers whose output file already exists are not downloaded again.
+    """
     # TODO:
     # - complete documentation
     # - clean up code (need helper functions lol)
@@ -33,7 +48,7 @@ def fetch_from_json(filepath: str | Path, output_dir: str | Path):
         raise ValueError(f"Could not find file at requested filepath { str(filepath) }")
     
     with open(filepath, "rb") as fp:
-        file_contents = json.load(fp)
+        file_contents = orjson.loads(fp.read())
         full_state_fetchers = {} # map of btype to fetcher
         additional_fetchers = defaultdict(lambda: defaultdict(lambda: defaultdict(str))) # map of scope to area name to btype to fetcher (lol)
     
@@ -63,31 +78,11 @@ def fetch_from_json(filepath: str | Path, output_dir: str | Path):
                         regex = dst_entry.get("regex")
                         if regex is not None:
                             src_to_dst_regex[src] = regex
-                    match src_format:
-                        case "arcgis_geojson":
-                            cur_fetcher = GeoJSONFetcher(
-                                url,
-                                src_to_dst_fields,
-                                src_to_dst_regex,
-                                True
-                            )
-                        case "geojson":
-                            cur_fetcher = GeoJSONFetcher(
-                                url,
-                                src_to_dst_fields,
-                                src_to_dst_regex,
-                                False
-                            )
-                        case "gdb":
-                            cur_fetcher = GDBFetcher(
-                                url,
-                                src_to_dst_fields,
-                                src_to_dst_regex,
-                                entry.get("folder_name"),
-                                entry.get("layer_name")
-                            )
-                        case _:
-                            raise ValueError(f"Source format { src_format } is not allowed")
+                    simplify_tolerance = entry.get("simplify_tolerance", 0.0)
+                    build_fetcher = _FETCHER_BUILDERS.get(src_format)
+                    if build_fetcher is None:
+                        raise ValueError(f"Source format { src_format } is not allowed")
+                    cur_fetcher = build_fetcher(url, src_to_dst_fields, src_to_dst_regex, entry, simplify_tolerance)
                     print(scope, area_name, btype, url, src_to_dst_fields)
                     if scope == "state":
                         full_state_fetchers[btype] = cur_fetcher
@@ -104,20 +99,45 @@ def fetch_from_json(filepath: str | Path, output_dir: str | Path):
         additional_fetchers,
         output_dir
     )
-    state_data_fetcher.fetch()
+    state_data_fetcher.fetch(overwrite_existing=overwrite_existing)
 
-@typechecked
 class _GeoFetcherBase:
     """A base class to fetch geodata from a single data source.
     
     Extending classes should override the function fetch_unchecked.
     """
 
+    # shared by every fetcher so requests to the same host reuse open connections
+    session = Session()
+
+    @classmethod
+    def size_connection_pool(cls, max_connections: int, hosts: int = 10):
+        """Sets the number of connections the shared session keeps open per host,
+        and the number of hosts it keeps connections open to.
+
+        max_connections should cover every request that may be in flight at once;
+        past it, requests wait for a kept-alive connection instead of dialing (and
+        then discarding) a new one. hosts should cover every host fetched from, as
+        the least recently used host's connections are closed to make room for a new
+        one. Transient gateway errors are retried with backoff rather than failing
+        the whole layer.
+        """
+        retries = Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+        for prefix in ("http://", "https://"):
+            cls.session.adapters[prefix].close()
+            cls.session.mount(prefix, HTTPAdapter(
+                pool_connections=hosts,
+                pool_maxsize=max_connections,
+                max_retries=retries,
+                pool_block=True
+            ))
+
     def __init__(self,
                  url: str,
                  src_to_dst_fields: Dict[str, str],
                  src_to_dst_regex: Dict[str, str],
-                 parameters: Dict[str, str] = {}):
+                 parameters: Dict[str, str] = {},
+                 simplify_tolerance: float = 0.0):
         """Initializes this fetcher.
         
         :param url: the web url to fetch data from.
@@ -133,21 +153,37 @@ class _GeoFetcherBase:
         :param parameters: parameters to include in the request on top of the
             provided URL.
         :type parameters: dict, optional
+        :param simplify_tolerance: if positive, boundaries are simplified so no vertex
+            moves more than this distance, in degrees, which makes later point lookups
+            cheaper. Shapes are simplified independently, so neighboring boundaries may
+            gain small gaps or overlaps; leave at 0 where exact edges matter.
+        :type simplify_tolerance: float, optional
         """
         self.req = Request("GET", url, params=parameters)
-        self.session = Session()
         self.src_to_dst_fields = src_to_dst_fields
         self.src_to_dst_regex = src_to_dst_regex
+        self.simplify_tolerance = simplify_tolerance
+        # "etag"/"last_modified" of the copy the current fetch compares against, and
+        # afterwards of the copy it downloaded
+        self.validators = {}
 
-    def fetch(self, timeout: int = 10) -> gpd.GeoDataFrame:
+    def fetch(self, timeout: int = 10, validators: Dict[str, str] | None = None) -> gpd.GeoDataFrame | None:
         """Fetches geodata from the source provided on initialization and
             returns it as a GeoPandas dataframe.
             
         :param timeout: the time, in seconds, to wait for a response from the source.
         :type timeout: int, optional
+        :param validators: the "etag"/"last_modified" of a copy already on disk; if
+            given, an unchanged source is not downloaded again. Nothing from an
+            earlier fetch is reused, so a copy that is gone is always downloaded.
+        :type validators: dict, optional
+        :return: the fetched geodata, or None if validators were given and the
+            source reports it has not changed since. After a download, the
+            fetcher's validators attribute holds those of the new copy.
 
         Note: this calls the fetch_unchecked function; make sure to override this.
         """
+        self.validators = dict(validators or {})
         try:
             return self.fetch_unchecked(timeout)
         except ConnectionError as exc:
@@ -157,11 +193,99 @@ class _GeoFetcherBase:
         except RequestException as exc:
             raise RuntimeError(f"An error occurred: {exc}") from exc
 
-    def fetch_unchecked(self, timeout: int = 10) -> gpd.GeoDataFrame:
+    def fetch_unchecked(self, timeout: int = 10) -> gpd.GeoDataFrame | None:
         """Fetch
         """
         warnings.warn("fetch_unchecked should be overriden by child classes.")
 
+    def _conditional_headers(self) -> Dict[str, str]:
+        """Returns the headers asking the source to reply 304 if it has not
+        changed since the copy described by this fetcher's validators."""
+        headers = {}
+        if self.validators.get("etag"):
+            headers["If-None-Match"] = self.validators["etag"]
+        if self.validators.get("last_modified"):
+            headers["If-Modified-Since"] = self.validators["last_modified"]
+        return headers
+
+    def _save_validators(self, response: Response):
+        """Records the validators of a freshly downloaded response, if the source sent any."""
+        self.validators = {
+            key: value for key, value in (
+                ("etag", response.headers.get("ETag")),
+                ("last_modified", response.headers.get("Last-Modified"))
+            ) if value
+        }
+
+    def _fetch_from_zip(self, pattern: str, timeout: int = 10, layer: str | None = None) -> gpd.GeoDataFrame | None:
+        """Downloads a zip archive and reads the first dataset in it whose name
+        matches the given glob pattern.
+
+        The dataset is read in place through GDAL's /vsizip/ filesystem, so the
+        archive is never extracted.
+
+        Args:
+            pattern: glob pattern for the dataset's file or directory name
+                (e.g., '*counties.gdb').
+            timeout: the time, in seconds, to wait for a response from the source.
+            layer: name of the layer to read, for multi-layer datasets.
+
+        Returns:
+            the dataset, or None if the archive has not changed since this
+            fetcher's validators were recorded.
+
+        Raises:
+            RuntimeError: if no dataset in the archive matches the pattern.
+        """
+        prepared_req = self.session.prepare_request(
+            self.req
+        )
+        prepared_req.headers.update(self._conditional_headers())
+        # archives are already compressed; compressing them again in transit only costs CPU
+        prepared_req.headers["Accept-Encoding"] = "identity"
+        with self.session.send(
+            prepared_req, stream=True, timeout=timeout
+        ) as response:
+            if response.status_code == 304:
+                return None
+            response.raise_for_status()
+            self._save_validators(response)
+            with TemporaryDirectory() as tempdir:
+                archive_path = Path(tempdir) / "archive.zip"
+                _GeoFetcherBase._write_body(response, archive_path)
+                with zipfile.ZipFile(archive_path, "r") as zip_ref:
+                    member = _GeoFetcherBase._find_zip_member(zip_ref.namelist(), pattern)
+                if member is None:
+                    raise RuntimeError(f"No dataset matching {pattern} found in requested archive")
+
+                # only the mapped attributes are read; GDAL skips the rest
+                return gpd.read_file(
+                    f"/vsizip/{archive_path}/{member}",
+                    layer=layer,
+                    engine="pyogrio",
+                    columns=list(self.src_to_dst_fields.keys())
+                )
+
+    @staticmethod
+    def _write_body(response: Response, path: Path):
+        """Writes the body of the given streamed response to path in chunks,
+        so it is never held in memory whole."""
+        # decoded as it is read, in case the server compressed it in transit
+        response.raw.decode_content = True
+        with open(path, "wb") as body_file:
+            shutil.copyfileobj(response.raw, body_file, length=1 << 20)
+
+    @staticmethod
+    def _find_zip_member(names: List[str], pattern: str) -> str | None:
+        """Returns the path inside a zip archive of the first file or directory
+        whose name matches the given glob pattern, or None if there is none."""
+        for name in names:
+            parts = PurePosixPath(name).parts
+            for i, part in enumerate(parts):
+                if fnmatch(part, pattern):
+                    return "/".join(parts[:i + 1])
+        return None
+
     @staticmethod
     def _process_column(initial_value, regex, dst_name):
         match = re.search(regex, initial_value)
@@ -189,25 +313,45 @@ class _GeoFetcherBase:
         for src_field in self.src_to_dst_fields:
             if src_field not in frame.columns:
                 raise ValueError(f"Given dataframe has invalid source column: {src_field}. Must be one of {list(self.src_to_dst_fields.keys())}")
-        frame.to_crs("epsg:4326", inplace=True)
-        new_frame = frame[list(self.src_to_dst_fields.keys()) + ["geometry"]]
+        # sources like ArcGIS already return WGS84, so only reproject frames that are not
+        if frame.crs is None:
+            frame.set_crs(_WGS84, inplace=True)
+        elif frame.crs != _WGS84:
+            frame.to_crs(_WGS84, inplace=True)
+        # rename returns a frame of its own, so the columns set below are written to it
+        # directly rather than through a chained-assignment-checked slice of frame
+        new_frame = frame.loc[:, list(self.src_to_dst_fields.keys()) + ["geometry"]].rename(self.src_to_dst_fields, axis=1)
         for src, regex in self.src_to_dst_regex.items():
             dst_name = self.src_to_dst_fields[src]
-            new_frame[src] = new_frame[src].apply(
+            new_frame[dst_name] = new_frame[dst_name].apply(
                 lambda initial_value: _GeoFetcherBase._process_column(initial_value, regex, dst_name)
             )
 
-        new_frame = new_frame.rename(self.src_to_dst_fields, axis=1)
+        if self.simplify_tolerance > 0:
+            new_frame["geometry"] = new_frame.geometry.simplify(self.simplify_tolerance, preserve_topology=True)
         
         if lower:
-            for c in new_frame.select_dtypes("object").columns:
-                new_frame[c] = new_frame[c].str.casefold()
+            # one assign replaces all string columns at once instead of a setitem per column
+            new_frame = new_frame.assign(**{
+                c: _GeoFetcherBase._casefold_column(new_frame[c])
+                for c in new_frame.select_dtypes("object").columns
+            })
         return new_frame
+
+    @staticmethod
+    def _casefold_column(column: pd.Series) -> pd.Series:
+        """Returns the given string column casefolded, folding each distinct value
+        only once since names (cities, districts, etc.) repeat across many rows."""
+        codes, uniques = pd.factorize(column)
+        # missing values get code -1, which reindexes to NaN just like .str.casefold() leaves them
+        folded = pd.Series(uniques, dtype=object).str.casefold().reindex(codes)
+        return pd.Series(folded.to_numpy(), index=column.index, name=column.name)
     
     def __str__(self):
         return f"Fetcher({ self.req.url }, { self.src_to_dst_fields })"
 
-@typechecked
+_GeoFetcherBase.size_connection_pool(32, hosts=32)
+
 class GeoWriter:
     @staticmethod
     def output_path(output_dir: Path, name: str, fileformat: str = "pickle"):
@@ -217,9 +361,16 @@ class GeoWriter:
 
     @staticmethod
     def write(boundaries: gpd.GeoDataFrame, output_dir: Path, output_filename: str, name: str):
-        output_path = output_dir / f"{output_filename}.gpkg"
+        """Writes the given boundaries as layer name of the GeoPackage output_filename.gpkg
+        in output_dir, creating output_dir if needed.
+
+        GeoPackage stores features as rows, so readers can stream or filter them
+        without loading the whole layer, as they could with newline-delimited GeoJSON.
+        """
+        output_path = GeoWriter.output_path(output_dir, output_filename, "gpkg")
         GeoWriter._handle_not_exists(output_dir, make_if_absent=True)
-        boundaries.to_file(output_path, layer=name, driver="GPKG")
+        # pyogrio writes whole columns through GDAL instead of fiona's per-feature records
+        boundaries.to_file(output_path, layer=name, driver="GPKG", engine="pyogrio")
 
     @staticmethod
     def nested_path(base: Path, subdirs: List[str], make_if_absent: bool = False) -> Path:
@@ -235,22 +386,16 @@ class GeoWriter:
         Raises:
             FileNotFoundError: if base directory or any child directory does not exist.
         """
-        GeoWriter._handle_not_exists(
-            base,
-            make_if_absent=make_if_absent,
-            not_exists_message=f"Given base directory does not exist: {base.absolute()}",
-        )
-        output_path = base
-
-        for subdir in subdirs:
-            output_path /= subdir
-
+        output_path = base.joinpath(*subdirs)
+        if make_if_absent:
+            # one call makes the base and every missing child
+            output_path.mkdir(parents=True, exist_ok=True)
+        elif not output_path.exists():
             GeoWriter._handle_not_exists(
-                output_path,
-                make_if_absent=make_if_absent,
-                not_exists_message=f"Child directory access failed. Directory does not exist: {output_path.absolute()}",
+                base,
+                not_exists_message=f"Given base directory does not exist: {base.absolute()}",
             )
-
+            raise FileNotFoundError(f"Child directory access failed. Directory does not exist: {output_path.absolute()}")
         return output_path
 
     @staticmethod
@@ -273,32 +418,29 @@ class GeoWriter:
         #     raise ValueError(f"Path must be a directory. Got {path}")
         if not path.exists():
             if make_if_absent:
-                path.mkdir(parents=True)
+                path.mkdir(parents=True, exist_ok=True)
             else:
                 raise FileNotFoundError(not_exists_message)
 
-@typechecked
 class GeoJSONFetcher(_GeoFetcherBase):
-    def __init__(self, url: str, src_to_dst_fields: Dict[str, str], src_to_dst_regex: Dict[str, str], from_arcgis: bool = True):
+    # pagination limits for ArcGIS layers
+    max_page_size = 2000
+    page_workers = 4
+
+    # the page helpers run once per page; only the configuration is type checked
+    @typechecked
+    def __init__(self, url: str, src_to_dst_fields: Dict[str, str], src_to_dst_regex: Dict[str, str], from_arcgis: bool = True, simplify_tolerance: float = 0.0):
         if from_arcgis: \
             params = {
                 "where": "1=1",
                 "outFields": ",".join(src_to_dst_fields.keys()),
-                "geometryType": "esriGeometryPolygon",
-                "spatialRel": "esriSpatialRelIntersects",
-                "units": "esriSRUnit_NauticalMile",
                 "returnGeometry": "true",
-                "returnTrueCurves": "false",
-                "returnIdsOnly": "false",
-                "returnCountOnly": "false",
                 "returnZ": "false",
                 "returnM": "false",
                 "outSR": "{\"wkid\": 4326}",
-                "returnDistinctValues": "false",
-                "returnExtentOnly": "false",
-                "sqlFormat": "none",
-                "resultOffsrt": 0,
-                "featureEncoding": "esriDefault",
+                # 6 decimal places of a degree is ~10 cm, far finer than precinct boundaries
+                # need, and trims the coordinate text that dominates each page
+                "geometryPrecision": "6",
                 "returnExceededLimitFeatures": "true",
                 "f": "geojson"
             }
@@ -309,105 +451,214 @@ class GeoJSONFetcher(_GeoFetcherBase):
             url,
             src_to_dst_fields,
             src_to_dst_regex,
-            params
+            params,
+            simplify_tolerance
         )
+        self.from_arcgis = from_arcgis
+
+    def fetch_unchecked(self, timeout: int = 10) -> gpd.GeoDataFrame | None:
+        if not self.from_arcgis:
+            return self._fetch_file(timeout)
+
+        # ask for the feature count and page size up front so every page can be requested at once
+        count = self._query_json({"returnCountOnly": "true", "f": "json"}, timeout).get("count", 0)
+        page_size = self._page_size(timeout)
+        offsets = range(0, max(count, 1), page_size)
+        # every page shares the same query but its offset, so it is prepared once
+        base_req = self.session.prepare_request(
+            Request("GET", self.req.url, params={**self.req.params, "resultRecordCount": page_size})
+        )
+        all_features = []
+        with ThreadPoolExecutor(max_workers=self.page_workers) as executor:
+            for page_features in executor.map(lambda offset: self._fetch_page(base_req, offset, page_size, timeout), offsets):
+                all_features.extend(page_features)
 
-    def fetch_unchecked(self, timeout: int = 10) -> gpd.GeoDataFrame:
-        result_offset = 0
-        table_parts = []
-        done_fetching = False
-        while not done_fetching:
-            self.req.params["resultOffset"] = result_offset
-            prepared_req = self.session.prepare_request(self.req)
-            
-            with self.session.send(
-                prepared_req, stream=True, timeout=timeout
-            ) as response:
-                response.raise_for_status()
-                raw_boundary_data = json.loads(response.content)
-                error = raw_boundary_data.get("error")
-                if error:
-                    raise RuntimeError(f"Could not process query: {error}")
-                props = raw_boundary_data.get("properties")
-                if props:
-                    exceeded = props.get("exceededTransferLimit")
-                    print(exceeded)
-                    if exceeded is None or exceeded == False:
-                        done_fetching = True
-                else:
-                    done_fetching = True
-
-                boundary_data = gpd.GeoDataFrame.from_features(
-                    raw_boundary_data["features"],
-                    crs="EPSG:4326"
-                )
-            num_items = len(boundary_data)
-            result_offset += num_items
-            table_parts.append(boundary_data)
-
-        full_table = pd.concat(table_parts, ignore_index=True)
-        self.req.params["resultOffset"] = 0
+        # geometries are built once for all pages instead of one frame per page plus a concat
+        full_table = GeoJSONFetcher._frame_from_features(all_features)
         return self._process_frame(full_table)
-    
-@typechecked
-class ShapefileFetcher(_GeoFetcherBase):
-    def __init__(self, url: str, src_to_dst_fields: Dict[str, str], src_to_dst_regex: Dict[str, str], src_name: str):
-        super().__init__(url, src_to_dst_fields, src_to_dst_regex)
-        self.src_name = src_name
 
-    def fetch_unchecked(self, dirs: str | List[str], timeout: int = 10) -> gpd.GeoDataFrame:
-        if isinstance(dirs, str):
-            pass
-
-        prepared_req = self.session.prepare_request(
-            self.req
-        )
+    def _fetch_page(self, base_req: PreparedRequest, result_offset: int, page_size: int, timeout: int = 10) -> List[Dict]:
+        """Fetches the GeoJSON features of the page of at most page_size features
+        starting at result_offset, using the already prepared page query base_req."""
+        features, exceeded_limit = self._query_page(base_req, result_offset, timeout)
+        page = features
+        # a server capping pages below page_size returns short pages while flagging that
+        # more features exist; the rest of the page is requested so no features are skipped
+        while exceeded_limit and features and len(page) < page_size:
+            features, exceeded_limit = self._query_page(base_req, result_offset + len(page), timeout)
+            page.extend(features)
+        return page[:page_size]
+
+    def _query_page(self, base_req: PreparedRequest, result_offset: int, timeout: int = 10) -> Tuple[List[Dict], bool]:
+        """Sends the prepared page query base_req from result_offset and returns
+        the features it got back, along with whether the server reported that
+        more features exist past them."""
+        prepared_req = base_req.copy()
+        prepared_req.url = f"{ base_req.url }&resultOffset={ result_offset }"
         with self.session.send(
             prepared_req, stream=True, timeout=timeout
         ) as response:
             response.raise_for_status()
+            # parse straight off the socket instead of buffering the whole body and
+            # holding it alongside its decoded form
+            response.raw.decode_content = True
+            features = []
+            exceeded_limit = False
+            for key, value in ijson.kvitems(response.raw, "", use_float=True):
+                if key == "error" and value:
+                    raise RuntimeError(f"Could not process query: {value}")
+                elif key == "features":
+                    features = value
+                elif key == "properties" and isinstance(value, dict):
+                    exceeded_limit = bool(value.get("exceededTransferLimit", False))
+            return features, exceeded_limit
+
+    @staticmethod
+    def _frame_from_features(features: List[Dict]) -> gpd.GeoDataFrame:
+        """Builds a WGS84 GeoDataFrame from GeoJSON features.
+
+        Polygon and MultiPolygon geometries, which boundary layers are made of, are
+        packed into flat coordinate and offset arrays and built in a single call
+        rather than one shape at a time. Any other geometry type falls back to
+        GeoDataFrame.from_features.
+        """
+        coords = []
+        ring_offsets = [0]
+        polygon_offsets = [0]
+        geometry_offsets = [0]
+        is_polygon = np.zeros(len(features), dtype=bool)
+        is_missing = np.zeros(len(features), dtype=bool)
+        for i, feature in enumerate(features):
+            geometry = feature.get("geometry")
+            if geometry is None:
+                is_missing[i] = True
+                polygons = []
+            elif geometry["type"] == "Polygon":
+                is_polygon[i] = True
+                polygons = [geometry["coordinates"]]
+            elif geometry["type"] == "MultiPolygon":
+                polygons = geometry["coordinates"]
+            else:
+                return gpd.GeoDataFrame.from_features(features, crs=_WGS84)
+            for polygon in polygons:
+                for ring in polygon:
+                    coords.extend(ring)
+                    ring_offsets.append(len(coords))
+                polygon_offsets.append(len(ring_offsets) - 1)
+            geometry_offsets.append(len(polygon_offsets) - 1)
+
+        try:
+            coords = np.asarray(coords, dtype=float)
+        except ValueError:
+            # coordinates of mixed dimensions are left to from_features
+            return gpd.GeoDataFrame.from_features(features, crs=_WGS84)
+        if not (coords.ndim == 2 and coords.shape[1] == 2):
+            # coordinates with z are left to from_features
+            return gpd.GeoDataFrame.from_features(features, crs=_WGS84)
+        geometries = shapely.from_ragged_array(
+            shapely.GeometryType.MULTIPOLYGON,
+            coords,
+            (np.asarray(ring_offsets), np.asarray(polygon_offsets), np.asarray(geometry_offsets))
+        )
+        # single polygons keep their type, as from_features would return them
+        geometries[is_polygon] = shapely.get_geometry(geometries[is_polygon], 0)
+        geometries[is_missing] = None
+
+        attributes = pd.DataFrame.from_records([feature.get("properties") or {} for feature in features])
+        return gpd.GeoDataFrame(attributes, geometry=geometries, crs=_WGS84)
+
+    def _page_size(self, timeout: int = 10) -> int:
+        """Returns the number of features to request per page: the layer's
+        maxRecordCount, capped at max_page_size."""
+        if not self.req.url.endswith("/query"):
+            return self.max_page_size
+        layer_url = self.req.url[:-len("/query")]
+        layer_info = self._query_json({"f": "json"}, timeout, url=layer_url)
+        return min(layer_info.get("maxRecordCount") or self.max_page_size, self.max_page_size)
+
+    def _query_json(self, params: Dict[str, str], timeout: int = 10, url: str | None = None) -> Dict:
+        """Sends a small JSON query (e.g., a feature count) and returns the decoded response.
+
+        Args:
+            params: parameters to send on top of (or instead of, for the same key)
+                this fetcher's query parameters. Ignored if url is given.
+            url: if given, sends only params to this url instead.
+        """
+        if url is None:
+            req = Request("GET", self.req.url, params={**self.req.params, **params})
+        else:
+            req = Request("GET", url, params=params)
+        with self.session.send(self.session.prepare_request(req), timeout=timeout) as response:
+            response.raise_for_status()
+            result = orjson.loads(response.content)
+        error = result.get("error")
+        if error:
+            raise RuntimeError(f"Could not process query: {error}")
+        return result
+
+    def _fetch_file(self, timeout: int = 10) -> gpd.GeoDataFrame | None:
+        """Fetches a plain (non-paginated) GeoJSON file, parsing it with GDAL
+        rather than decoding it to Python objects first. Returns None if the
+        file has not changed since this fetcher's validators were recorded."""
+        prepared_req = self.session.prepare_request(self.req)
+        prepared_req.headers.update(self._conditional_headers())
+        with self.session.send(prepared_req, stream=True, timeout=timeout) as response:
+            if response.status_code == 304:
+                return None
+            response.raise_for_status()
+            self._save_validators(response)
             with TemporaryDirectory() as tempdir:
-                with zipfile.ZipFile(BytesIO(response.content), "r") as zip_ref:
-                    zip_ref.extractall(tempdir)
-                    shps = tempdir.rglob(f"{self.src_name}*.shp")
-                    first_shp_path = next(shps, None)
-                    if first_shp_path is None:
-                        raise RuntimeError(f"No shapefile with name {self.src_name} found in requested directory")
-                    
-                    boundary_data = gpd.read_file(first_shp_path)
+                # streamed to disk so the whole file is never buffered in memory
+                file_path = Path(tempdir) / "boundaries.geojson"
+                _GeoFetcherBase._write_body(response, file_path)
+                boundary_data = gpd.read_file(
+                    file_path,
+                    engine="pyogrio",
+                    columns=list(self.src_to_dst_fields.keys())
+                )
+        return self._process_frame(boundary_data)
+    
+@typechecked
+class ShapefileFetcher(_GeoFetcherBase):
+    def __init__(self, url: str, src_to_dst_fields: Dict[str, str], src_to_dst_regex: Dict[str, str], src_name: str, simplify_tolerance: float = 0.0):
+        super().__init__(url, src_to_dst_fields, src_to_dst_regex, simplify_tolerance=simplify_tolerance)
+        self.src_name = src_name
 
+    def fetch_unchecked(self, timeout: int = 10) -> gpd.GeoDataFrame | None:
+        boundary_data = self._fetch_from_zip(f"{self.src_name}*.shp", timeout)
+        if boundary_data is None:
+            return None
         return self._process_frame(boundary_data)
 
 @typechecked
 class GDBFetcher(_GeoFetcherBase):
-    def __init__(self, url: str, src_to_dst_fields: Dict[str, str], src_to_dst_regex: Dict[str, str], src_name: str, layer_name: str):
-        super().__init__(url, src_to_dst_fields, src_to_dst_regex)
+    def __init__(self, url: str, src_to_dst_fields: Dict[str, str], src_to_dst_regex: Dict[str, str], src_name: str, layer_name: str, simplify_tolerance: float = 0.0):
+        super().__init__(url, src_to_dst_fields, src_to_dst_regex, simplify_tolerance=simplify_tolerance)
         self.src_name = src_name
         self.layer_name = layer_name
     
-    def fetch_unchecked(self, timeout: int = 10) -> gpd.GeoDataFrame:
-        prepared_req = self.session.prepare_request(
-            self.req
-        )
-        with self.session.send(
-            prepared_req, stream=True, timeout=timeout
-        ) as response:
-            response.raise_for_status()
-            with TemporaryDirectory() as tempdir:
-                with zipfile.ZipFile(BytesIO(response.content), "r") as zip_ref:
-                    zip_ref.extractall(tempdir)
-                
-                gdbs = Path(tempdir).rglob(f"*{self.src_name}.gdb")
-                # print([p for p in Path(tempdir).rglob("*")])
-                first_gdb_path = next(gdbs, None)
-                if first_gdb_path is None:
-                    raise RuntimeError(f"No gdb with name {self.src_name} found in requested directory")
-                
-                boundary_data = gpd.read_file(first_gdb_path, layer=self.layer_name)
-
+    def fetch_unchecked(self, timeout: int = 10) -> gpd.GeoDataFrame | None:
+        boundary_data = self._fetch_from_zip(f"*{self.src_name}.gdb", timeout, layer=self.layer_name)
+        if boundary_data is None:
+            return None
         return self._process_frame(boundary_data)
 
 
+# maps each config "source_format" to a function building its fetcher from the url,
+# field mappings, regexes, full config entry, and simplify tolerance
+_FETCHER_BUILDERS = {
+    "arcgis_geojson": lambda url, fields, regex, entry, tolerance: GeoJSONFetcher(
+        url, fields, regex, True, tolerance
+    ),
+    "geojson": lambda url, fields, regex, entry, tolerance: GeoJSONFetcher(
+        url, fields, regex, False, tolerance
+    ),
+    "gdb": lambda url, fields, regex, entry, tolerance: GDBFetcher(
+        url, fields, regex, entry.get("folder_name"), entry.get("layer_name"), tolerance
+    ),
+}
+
+
 @typechecked
 class StateDataFetcher:
     """A base class used to fetch geodata for a state"""
@@ -444,40 +695,69 @@ class StateDataFetcher:
         self.full_state_fetchers = full_state_fetchers
         self.additional_fetchers = additional_fetchers
 
-    def fetch(self):
+    def fetch(self, overwrite_existing: bool = True, max_workers: int = 8):
         """Fetches all data for this state and writes to the state's directory under datasets.
         Output files are in geoJSON format
 
         Args:
             overwrite_existing: if True, overwrites any existing state files where there is a
                 naming collision. Otherwise, does not fetch this data.
+            max_workers: the maximum number of layers to download at the same time.
         """
-        state_layers_output_path = self.state_output_path / "state"
-        for name, fetcher in self.full_state_fetchers.items():
-            print(name)
-            geodata = fetcher.fetch()
-            GeoWriter.write(geodata, state_layers_output_path, name, name)
-            # try:                
-            # except RuntimeError as e:
-            #     warnings.warn(
-            #         f"Encountered error with { name } at state level",
-            #         source = e
-            #     )
+        # output directories are made up front so the download threads only write files
+        validators_dir = GeoWriter.nested_path(self.state_output_path, [".validators"], make_if_absent=True)
+        tasks = [] # list of (fetcher, output directory, layer name, progress label, validators path)
+        if self.full_state_fetchers:
+            state_layers_output_path = GeoWriter.nested_path(self.state_output_path, ["state"], make_if_absent=True)
+            for name, fetcher in self.full_state_fetchers.items():
+                if overwrite_existing or not GeoWriter.output_path(state_layers_output_path, name, "gpkg").exists():
+                    validators_path = validators_dir / f"state__{ name }.json"
+                    tasks.append((fetcher, state_layers_output_path, name, (name,), validators_path))
 
         for btype, data in self.additional_fetchers.items():
             for region_name, layers in data.items():
                 nested_dirs = [btype, region_name]
                 output_dir = GeoWriter.nested_path(self.state_output_path, nested_dirs, make_if_absent=True)
                 for name, layer_fetcher in layers.items():
-                    print(btype, region_name, name)
-                    geodata = layer_fetcher.fetch()
-                    GeoWriter.write(geodata, output_dir, name, name)
-                    # try:
-                    # except RuntimeError as e:
-                    #     warnings.warn(
-                    #         f"Encountered error with { name } at state level",
-                    #         source = e
-                    #     )
+                    # checked before anything is downloaded, so a warm output directory costs no requests
+                    if overwrite_existing or not GeoWriter.output_path(output_dir, name, "gpkg").exists():
+                        validators_path = validators_dir / f"{ btype }__{ region_name }__{ name }.json"
+                        tasks.append((layer_fetcher, output_dir, name, (btype, region_name, name), validators_path))
+
+        # downloads are network-bound, so layers are fetched concurrently;
+        # each task writes to its own file. each layer may have a full set of pages in flight,
+        # and every host keeps its connections for the whole run
+        hosts = {urlparse(task[0].req.url).netloc for task in tasks}
+        _GeoFetcherBase.size_connection_pool(max_workers * GeoJSONFetcher.page_workers, hosts=max(len(hosts), 1))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(StateDataFetcher._fetch_layer, *task): task for task in tasks}
+            for future in as_completed(futures):
+                label = futures[future][3]
+                try:
+                    future.result()
+                except RuntimeError as e:
+                    # a layer that cannot be fetched should not stop the others
+                    warnings.warn(f"Encountered error fetching { ' '.join(label) }: { e }")
+
+    @staticmethod
+    def _fetch_layer(fetcher: _GeoFetcherBase, output_dir: Path, name: str, label: Tuple[str, ...], validators_path: Path):
+        print(*label)
+        output_path = GeoWriter.output_path(output_dir, name, "gpkg")
+        # ETag/Last-Modified of the copy on disk, so an unchanged source answers with a bare 304.
+        # these are kept apart from the layer files so the parser never mistakes them for boundaries
+        validators = None
+        if output_path.exists() and validators_path.exists():
+            validators = orjson.loads(validators_path.read_bytes())
+
+        geodata = fetcher.fetch(validators=validators)
+        if geodata is None:
+            print(*label, "is unchanged")
+            return
+        GeoWriter.write(geodata, output_dir, name, name)
+        if fetcher.validators:
+            validators_path.write_bytes(orjson.dumps(fetcher.validators))
+        else:
+            validators_path.unlink(missing_ok=True)
 
 
 @typechecked
@@ -1,17 +1,24 @@
 from __future__ import annotations
+import json
 import shutil
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 import geopandas as gpd
+import numpy as np
 import pandas as pd
+import shapely
 from pathlib import Path
 from shapely.geometry.point import Point
 from shapely.geometry.polygon import Polygon
 from shapely.geometry.multipolygon import MultiPolygon
-from typing import Collection, Dict, List
+from typing import Collection, Dict
 from typeguard import typechecked
-from precinct_mapper.data.containers import Region, State
+from precinct_mapper.data.containers import State
 
-@typechecked
 class StateParser:
+    # only the public entry points are type checked; the static helpers run once per
+    # precinct or region, where typeguard's per-call checks would dominate
+    @typechecked
     def __init__(self,
                  datapath: str | Path,
                  output_dir: str | Path,
@@ -33,47 +40,99 @@ class StateParser:
         if self.primary_table_path is None:
             raise FileNotFoundError(f"No file named { primary_table_name }.* exists in the directory { datapath } or its children.")
 
-    def parse(self, recompile: bool = False) -> State:
+    @typechecked
+    def parse(self, recompile: bool = False, use_cache: bool = False) -> State:
         if recompile:
             self._invert_regional_data()
 
+        # with use_cache, the joined result is saved next to the compiled tables, along with
+        # the path and modification time of every table it was built from; it is reused
+        # only while that set of tables is exactly the same
+        cache_path = self.output_dir / "state.pkl"
+        sources_path = self.output_dir / "state.sources.json"
+        if use_cache:
+            sources = self._cache_sources()
+            if StateParser._is_cache_fresh(cache_path, sources_path, sources):
+                return State.from_cache(cache_path)
+
         # state_tables = StateParser._read_directory_tables(self.state_tables_datapath,
         #                                                   exclude=["precinct"])
         tables = StateParser._read_directory_tables(self.output_dir, exclude=[self.primary_table_path.stem])
         # all_tables = state_tables
         # all_tables.update(region_tables)
 
-        primary_table = gpd.read_file(self.primary_table_path)
+        primary_table = gpd.read_file(self.primary_table_path, engine="pyogrio")
 
         primary_table_filled = primary_table
-        for btype, binfo in tables.items():
-            # print(f"Parsing btype: { btype }")
-            primary_table_filled[btype] = primary_table_filled.apply(lambda row: StateParser._get_bounding_region_index(row["geometry"], binfo), axis=1)
+        # the point each precinct is located by is the same for every layer, so it is found once
+        query_points = primary_table_filled.geometry.apply(StateParser._get_query_point)
+        # layers are independent, and shapely releases the GIL inside its vectorized
+        # calls, so the layers are joined on threads without copying tables to processes
+        with ThreadPoolExecutor() as executor:
+            region_indices = executor.map(
+                lambda binfo: StateParser._get_bounding_region_indices(query_points, binfo),
+                tables.values()
+            )
+            for btype, btype_indices in zip(tables, region_indices):
+                # print(f"Parsing btype: { btype }")
+                # store region ids as nullable integers rather than floats/objects holding NaN
+                primary_table_filled[btype] = btype_indices.astype("Int32")
         
-        return State(tables, primary_table_filled)
+        state = State(tables, primary_table_filled)
+        if use_cache:
+            state.to_cache(cache_path)
+            # written after the cache, so a cache without a matching record is never reused
+            with open(sources_path, "w") as sources_file:
+                json.dump(sources, sources_file)
+        return state
+
+    def _cache_sources(self) -> Dict[str, int]:
+        """Returns the path and modification time (in nanoseconds) of the primary table
+        and every compiled region table."""
+        sources = [self.primary_table_path, *self.output_dir.glob("*.gpkg")]
+        return {str(source.absolute()): source.stat().st_mtime_ns for source in sources}
+
+    @staticmethod
+    def _is_cache_fresh(cache_path: Path, sources_path: Path, sources: Dict[str, int]) -> bool:
+        """Returns whether the cached State at cache_path exists and was built from
+        exactly the given tables, none of which has changed since."""
+        if not (cache_path.is_file() and sources_path.is_file()):
+            return False
+        with open(sources_path) as sources_file:
+            try:
+                cached_sources = json.load(sources_file)
+            except ValueError:
+                return False
+        return cached_sources == sources
             
     def _invert_regional_data(self):
         shutil.rmtree(self.output_dir)
         self.output_dir.mkdir()
-        for scope in self.datapath.iterdir():
-            if scope.is_dir() and scope.stem not in ("region_tables"):
-                for region_name in scope.iterdir():
-                    if region_name.is_dir():
-                        # print(f"Region { region_name } has files: [{ [g for g in region_name.glob('*.*')] }]")
-                        for boundary in region_name.glob("*.*"):
-                            # print(f"Inverting: { scope }, { region_name }, { boundary }")
-                            boundary_outpath = self.output_dir / f"{ boundary.stem }.gpkg"
-                            table = None
-                            new_boundary_table = gpd.read_file(boundary)
-                            new_boundary_table["region_name"] = region_name.stem
-                            new_boundary_table["scope"] = scope.stem
-                            if boundary_outpath.exists():
-                                existing_table = gpd.read_file(boundary_outpath)
-                                tables = [existing_table, new_boundary_table]
-                                table = gpd.GeoDataFrame(pd.concat(tables, ignore_index=True), crs=tables[0].crs)
-                            else:
-                                table = new_boundary_table
-                            table.to_file(boundary_outpath)
+        # collect every region's table per btype and write each btype once, rather
+        # than re-reading and re-writing the growing output file for every region
+        btype_tables = defaultdict(list)
+        # every region layer is listed up front, so the reads run from one flat list
+        layer_tasks = [(scope, region_name, boundary)
+                       for scope in self.datapath.iterdir()
+                       if scope.is_dir() and scope.stem not in ("region_tables")
+                       for region_name in scope.iterdir()
+                       if region_name.is_dir()
+                       for boundary in region_name.glob("*.*")]
+        # pyogrio releases the GIL while reading, so the layers are read on threads
+        with ThreadPoolExecutor() as executor:
+            boundary_tables = executor.map(lambda task: gpd.read_file(task[2], engine="pyogrio"), layer_tasks)
+            for (scope, region_name, boundary), new_boundary_table in zip(layer_tasks, boundary_tables):
+                new_boundary_table["region_name"] = region_name.stem
+                new_boundary_table["scope"] = scope.stem
+                btype_tables[boundary.stem].append(new_boundary_table)
+
+        for btype, tables in btype_tables.items():
+            boundary_outpath = self.output_dir / f"{ btype }.gpkg"
+            if len(tables) == 1:
+                table = tables[0]
+            else:
+                table = gpd.GeoDataFrame(pd.concat(tables, ignore_index=True), crs=tables[0].crs)
+            table.to_file(boundary_outpath, engine="pyogrio")
 
     @staticmethod
     def _read_directory_tables(dirpath: str | Path,
@@ -88,7 +147,7 @@ class StateParser:
         for file in dirpath.glob(filepattern):
             if file.stem not in exclude:
                 # print(f"File: {file}")
-                table = gpd.read_file(file)
+                table = gpd.read_file(file, engine="pyogrio")
                 tables[file.stem] = table
         return tables
     
@@ -99,38 +158,28 @@ class StateParser:
         
         match filepath.suffix:
             case ".gpkg":
-                return gpd.read_file(filepath, layer=filepath.stem)
+                return gpd.read_file(filepath, layer=filepath.stem, engine="pyogrio")
             case ".pkl":
                 return pd.read_pickle(filepath)
             case _:
-                return gpd.read_file(filepath)
+                return gpd.read_file(filepath, engine="pyogrio")
     
     @staticmethod
-    def _validate_boundary_results(results: gpd.GeoDataFrame, point: Point) -> Region | None:
-        nrows = len(results)
-        if nrows == 0:
-            return None
-        elif nrows > 1:
-            results.plot(figsize=(15, 12), color=["lightblue", "purple"], edgecolor="black", alpha=0.2)
-            # print(results.iloc[0]["geometry"].contains(results.iloc[1]["geometry"]), results.iloc[0]["geometry"].within(results.iloc[1]["geometry"]))
-            raise RuntimeError(f"Multiple boundaries contained {point}: {results['region']}.")
-        
-        return results.iloc[0]["region"]
-            
-    @staticmethod
-    def _get_bounding_region_of_point(point: Point, regions_table: gpd.GeoDataFrame) -> Region | None:
-        containing = regions_table.loc[regions_table.contains(point)]
-        return StateParser._validate_boundary_results(containing, point)
+    def _largest_polygon(shape: MultiPolygon) -> Polygon:
+        """Returns the largest polygon of the given multipolygon, with all part areas
+        computed in one call."""
+        parts = shapely.get_parts(shape)
+        return parts[shapely.area(parts).argmax()]
 
     @staticmethod
-    def _get_bounding_region(shape: Point | Polygon | MultiPolygon, regions_table: gpd.GeoDataFrame) -> Region | None:
-        if not ("geometry" in regions_table and "region" in regions_table):
-            raise ValueError(f"Given regions table is missing one of the columns [\'geometry\', \'region\']. Given columns: {list(regions_table.columns)}")
-
+    def _get_query_point(shape: Point | Polygon | MultiPolygon) -> Point:
+        """Returns the point used to find the regions containing the given shape: the shape
+        itself if it is a point, else a point inside its largest polygon (the centroid if
+        that lies inside it)."""
         if isinstance(shape, Point):
-            return StateParser._get_bounding_region_of_point(shape, regions_table)
+            return shape
         elif isinstance(shape, MultiPolygon):
-            polygon = max(shape.geoms, key = lambda p: p.area) # get the largest polygon
+            polygon = StateParser._largest_polygon(shape)
         elif isinstance(shape, Polygon):
             polygon = shape
         else:
@@ -138,58 +187,32 @@ class StateParser:
         point = polygon.centroid
         if not point.within(polygon):
             point = polygon.representative_point()
-        return StateParser._get_bounding_region_of_point(point, regions_table)
-
-    @staticmethod                                   
-    def _row_to_region(btype: str, column_names: pd.Index, row: pd.core.series.Series | gpd.GeoSeries) -> Region:
-        metadata = {}
-        for col in [col for col in column_names if col not in {"name", "geometry", "id"}]:
-            metadata[col] = row.get(col, None)
-
-        return Region(
-            btype,
-            row.get("name", None),
-            row.get("geometry", None),
-            row.get("id", None),
-            metadata=metadata
-        )
+        return point
 
     @staticmethod
-    def _extract_value(key: str, column_names: pd.Index, row: gpd.GeoSeries):
-        if key in column_names:
-            return row[column_names]
-        return None
+    def _get_bounding_region_indices(points: gpd.GeoSeries, binfo: gpd.GeoDataFrame) -> pd.Series:
+        """Returns, for each of the given points, the index in binfo of the region containing
+        it, or NaN if there is none. All points are matched to the regions at once rather
+        than tested one at a time.
 
-    @staticmethod
-    def _validate_boundary_index_results(results: List[int], binfo: gpd.GeoDataFrame, point: Point) -> int | None:
-        nrows = len(results)
-        if nrows == 0:
-            return None
-        elif nrows > 1:
-            multi_match_rows = binfo.iloc[results]
-            raise RuntimeError(f"Multiple boundaries contained {point}: {multi_match_rows}.")
-        return results[0]
-    
-    @staticmethod   
-    def _get_bounding_region_index_point(point: Point, binfo: gpd.GeoDataFrame) -> int | None:
-        containing = binfo.index[binfo.contains(point)].to_list()
-        return StateParser._validate_boundary_index_results(containing, binfo, point)
-
-    @staticmethod
-    def _get_bounding_region_index(shape: Point | Polygon | MultiPolygon, binfo: gpd.GeoDataFrame) -> int | None:
+        Raises:
+            ValueError: if binfo has no geometry column.
+            RuntimeError: if a point is contained by more than one region.
+        """
         if not "geometry" in binfo:
             raise ValueError(f"Given regions table is missing one of the columns [\'geometry\']. Given columns: {list(binfo.columns)}")
+        regions = np.asarray(binfo.geometry.values)
+        # prepared regions answer repeated point-in-polygon tests without re-walking their rings
+        shapely.prepare(regions)
+        point_geoms = np.asarray(points.values)
+        xs, ys = shapely.get_x(point_geoms), shapely.get_y(point_geoms)
+        point_idx, region_idx = State._containing_pairs(binfo.sindex, regions, xs, ys)
 
-        if isinstance(shape, Point):
-            return StateParser._get_bounding_region_index_point(shape, binfo)
-        elif isinstance(shape, MultiPolygon):
-            polygon = max(shape.geoms, key = lambda p: p.area) # get the largest polygon
-        elif isinstance(shape, Polygon):
-            polygon = shape
-        else:
-            raise ValueError(f"shape type { type(shape) } is not valid.")
-        point = polygon.centroid
-        if not point.within(polygon):
-            point = polygon.representative_point()
-    
-        return StateParser._get_bounding_region_index_point(point, binfo)
+        counts = np.bincount(point_idx, minlength=len(points))
+        if (counts > 1).any():
+            first_point = int(np.argmax(counts > 1))
+            multi_match_rows = binfo.iloc[np.sort(region_idx[point_idx == first_point])]
+            raise RuntimeError(f"Multiple boundaries contained {points.iloc[first_point]}: {multi_match_rows}.")
+        result = pd.Series(np.nan, index=points.index)
+        result.iloc[point_idx] = binfo.index[region_idx]
+        return result